@@ -7,7 +7,12 @@ from .models import (
     CartItem, 
     Cart,
     Order, 
-    OrderItem
+    OrderItem,
+    TransactionArchive,
+    OrderArchive,
+    OrderItemArchive,
+    DailySales,
+    DailyProductSales,
 )
 
 admin.site.register(Product)
@@ -17,3 +22,8 @@ admin.site.register(CartItem)
 admin.site.register(Cart)
 admin.site.register(Order)
 admin.site.register(OrderItem)
+admin.site.register(TransactionArchive)
+admin.site.register(OrderArchive)
+admin.site.register(OrderItemArchive)
+admin.site.register(DailySales)
+admin.site.register(DailyProductSales)
@@ -0,0 +1,106 @@
+import csv
+import hashlib
+import json
+from itertools import islice
+
+from .models import Product
+
+# Supplier feeds are parsed one row at a time and upserted in fixed-size
+# chunks keyed on Product.sku, so memory stays flat however large the feed is.
+# Each product stores a hash of its imported fields, and rows whose hash hasn't
+# changed are skipped without a write.
+
+FIELDS = ('name', 'price', 'quantity', 'description')
+MAX_REPORTED_ERRORS = 20
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield one row per product from a text stream in `csv` or `ndjson` format.
+    CSV rows are dicts; NDJSON rows are the raw lines, decoded in _clean so a
+    malformed line is rejected like any other bad row.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'ndjson':
+        for line in stream:
+            if line.strip():
+                yield line
+    else:
+        raise ValueError(f"Unsupported catalog format: {fmt}")
+
+
+def _max_length(field):
+    return Product._meta.get_field(field).max_length
+
+
+def _clean(row):
+    if isinstance(row, str):
+        row = json.loads(row)
+    sku = str(row.get('sku') or '').strip()
+    if not sku:
+        raise ValueError("missing sku")
+    name = str(row.get('name') or '').strip()
+    if not name:
+        raise ValueError("missing name")
+    for field, value in (('sku', sku), ('name', name)):
+        if len(value) > _max_length(field):
+            raise ValueError(f"{field} is longer than {_max_length(field)} characters")
+    return {
+        'sku': sku,
+        'name': name,
+        'price': int(row['price']),
+        'quantity': int(row.get('quantity') or 1),
+        'description': str(row.get('description') or ''),
+    }
+
+
+def _content_hash(values):
+    payload = json.dumps([values[field] for field in FIELDS])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _upsert_chunk(chunk, stats):
+    products = {}
+    for line_number, row in chunk:
+        try:
+            values = _clean(row)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            stats['errors'] += 1
+            if len(stats['error_details']) < MAX_REPORTED_ERRORS:
+                stats['error_details'].append(f"row {line_number}: {e}")
+            continue
+        # A later row for the same SKU wins, as it would in a row-by-row load
+        products[values['sku']] = Product(content_hash=_content_hash(values), **values)
+
+    existing = dict(
+        Product.objects.filter(sku__in=products.keys()).values_list('sku', 'content_hash')
+    )
+    changed = [p for sku, p in products.items() if existing.get(sku) != p.content_hash]
+    stats['unchanged'] += len(products) - len(changed)
+    stats['created'] += sum(1 for p in changed if p.sku not in existing)
+    stats['updated'] += sum(1 for p in changed if p.sku in existing)
+
+    if changed:
+        Product.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=list(FIELDS) + ['content_hash'],
+        )
+
+
+def import_products(rows, chunk_size=1000):
+    """
+    Upsert products from an iterable of row dicts, `chunk_size` rows at a time.
+    Returns counts of the rows read, created, updated, unchanged and rejected.
+    """
+    stats = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0, 'error_details': []}
+    numbered = enumerate(rows, start=1)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        stats['rows'] += len(chunk)
+        _upsert_chunk(chunk, stats)
+    return stats
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Transaction, Order
+
+# Payment status events, keyed by transaction reference. The webhook publishes
+# from a worker thread and the SSE stream subscribes from the event loop.
+# The broker class comes from settings.PAYMENT_EVENTS_BROKER so a shared
+# broker (e.g. Redis pub/sub) can replace the in-process one; it only needs
+# `publish(channel, message)` and an async context manager `subscribe(channel)`
+# that yields an object with an awaitable `get()`.
+
+
+class InProcessBroker:
+    """
+    Fans messages out to subscribers in this process only.
+    Each subscriber is an asyncio.Queue bound to the loop that created it.
+    """
+    max_queued = 100
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        entry = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers[channel].add(entry)
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                subscribers = self._subscribers[channel]
+                subscribers.discard(entry)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            entries = list(self._subscribers.get(channel, ()))
+        for loop, queue in entries:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                pass
+
+    @staticmethod
+    def _offer(queue, message):
+        # A slow client loses its oldest message rather than blocking the publisher
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.PAYMENT_EVENTS_BROKER)()
+
+
+def publish(reference, event, data):
+    get_broker().publish(reference, {'event': event, 'data': data})
+
+
+# ------------------------
+# SSE stream for one payment
+# ------------------------
+TERMINAL_EVENTS = ('order',)
+
+
+def order_event(order):
+    return {
+        'reference': order.reference,
+        'order_id': order.id,
+        'status': order.status,
+        'total_amount': order.total_amount,
+    }
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _snapshot(reference):
+    # Read from the primary; a replica may not have the webhook's update yet
+    transaction = await Transaction.objects.using('default').filter(reference=reference).afirst()
+    order = await Order.objects.using('default').filter(reference=reference).afirst()
+    return transaction, order
+
+
+async def payment_event_stream(reference):
+    """
+    Send the current status, then each change published by the webhook.
+    The database is read once, after subscribing so nothing published in
+    between is missed; after that the stream only waits on the broker and
+    sends a comment every SSE_KEEPALIVE_SECONDS. It ends once the order exists
+    or after SSE_MAX_SECONDS, when the client's EventSource reconnects and
+    re-reads the current status. Delivery across worker processes is the
+    broker's job (see PAYMENT_EVENTS_BROKER).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SSE_MAX_SECONDS
+
+    async with get_broker().subscribe(reference) as messages:
+        transaction, order = await _snapshot(reference)
+        last_status = transaction.status if transaction is not None else None
+        if last_status is not None:
+            yield _sse('transaction', {'reference': reference, 'status': last_status})
+        if order is not None:
+            yield _sse('order', order_event(order))
+            return
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(
+                    messages.get(), timeout=min(settings.SSE_KEEPALIVE_SECONDS, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+
+            if message['event'] == 'transaction':
+                if message['data']['status'] == last_status:
+                    continue
+                last_status = message['data']['status']
+            yield _sse(message['event'], message['data'])
+            if message['event'] in TERMINAL_EVENTS:
+                return
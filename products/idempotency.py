@@ -0,0 +1,125 @@
+import hashlib
+import json
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+# Clients send an `Idempotency-Key` header on retryable POSTs. The first request
+# with a key inserts an IdempotencyKey row, which the unique (user, key)
+# constraint turns into a lock: a concurrent duplicate fails the insert and
+# waits for the first request's stored response instead of running the view.
+# Each claim gets its own token, so a request whose key was taken over after its
+# lease ran out can't store or delete the new holder's result.
+
+HEADER = 'Idempotency-Key'
+POLL_INTERVAL = 0.1
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path} {body}".encode()).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """
+    Insert the key for `user`, replacing it if it has expired and taking it
+    over if its first request died without storing a response.
+    Returns (record, created).
+    """
+    now = timezone.now()
+    lease = {
+        'claim_token': uuid.uuid4().hex,
+        'fingerprint': fingerprint,
+        'locked_until': now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+        'expires_at': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+    }
+    for _ in range(2):
+        try:
+            with db_transaction.atomic():
+                record = IdempotencyKey.objects.create(user=user, key=key, **lease)
+            return record, True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if record is None:
+                continue
+            if record.expires_at <= now:
+                IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+                continue
+            if record.status_code is None and record.locked_until <= now:
+                # The worker holding the claim was killed or failed to store its
+                # response; only one retry can win the takeover
+                taken = IdempotencyKey.objects.filter(
+                    pk=record.pk, status_code__isnull=True, locked_until__lte=now
+                ).update(**lease)
+                if taken:
+                    return IdempotencyKey.objects.get(pk=record.pk), True
+                continue
+            return record, False
+    return IdempotencyKey.objects.filter(user=user, key=key).first(), False
+
+
+def _wait_for_response(record):
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while record is not None and record.status_code is None and time.monotonic() < deadline:
+        if record.locked_until <= timezone.now():
+            break
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def idempotent(view_method):
+    """
+    Store the first response to each `Idempotency-Key` and replay it for
+    duplicate requests without running the view again.
+    Server errors aren't stored, so the client can retry them.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': f'{HEADER} must be at most 255 characters'}, status=400)
+
+        fingerprint = _fingerprint(request)
+        record, created = _claim(request.user, key, fingerprint)
+
+        if not created:
+            if record is not None and record.fingerprint != fingerprint:
+                return Response({'error': f'{HEADER} was already used for a different request'}, status=422)
+            record = _wait_for_response(record)
+            if record is None or record.status_code is None:
+                # The first request may have died while we waited
+                record, created = _claim(request.user, key, fingerprint)
+
+        if not created:
+            if record is None or record.status_code is None:
+                return Response({'error': f'A request with this {HEADER} is still in progress'}, status=409)
+            response = Response(record.response_body, status=record.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        # Only touch the row while this request still holds the claim
+        claim = IdempotencyKey.objects.filter(pk=record.pk, claim_token=record.claim_token)
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            claim.delete()
+            raise
+
+        if response.status_code >= 500:
+            claim.delete()
+        else:
+            claim.update(status_code=response.status_code, response_body=response.data)
+        return response
+
+    return wrapper
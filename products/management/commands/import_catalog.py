@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.catalog_import import import_products, iter_rows
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+class Command(BaseCommand):
+    help = "Stream a CSV or NDJSON supplier feed into the catalog, upserting products by SKU."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file with sku, name, price, quantity and description columns")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Feed format (default: taken from the file extension)")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows upserted per query")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt in ('jsonl', 'json'):
+            fmt = 'ndjson'
+        if fmt not in ('csv', 'ndjson'):
+            raise CommandError("Couldn't tell the feed format from the file name, pass --format")
+
+        started = time.monotonic()
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as stream:
+                stats = import_products(iter_rows(stream, fmt), chunk_size=options['chunk_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        rate = stats['rows'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{stats['rows']} rows in {elapsed:.2f}s ({rate:.0f} rows/s): "
+            f"{stats['created']} created, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, {stats['errors']} rejected"
+        )
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(f"Peak memory: {peak:.1f} MB")
+        for detail in stats['error_details']:
+            self.stderr.write(detail)
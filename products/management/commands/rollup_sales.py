@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products import reporting
+
+
+class Command(BaseCommand):
+    help = "Fold orders created since the last run into the daily sales rollups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Orders read per batch")
+
+    def handle(self, *args, **options):
+        recorded = reporting.catch_up(batch_size=options['batch_size'])
+        self.stdout.write(f"{recorded} orders added to the daily sales rollups")
@@ -0,0 +1,45 @@
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive old transactions and orders, and purge abandoned carts, stale "
+        "pending transactions and expired idempotency keys, in small throttled batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archive-days', type=int, default=settings.RETENTION_ARCHIVE_DAYS,
+                            help="Archive transactions and orders older than this many days")
+        parser.add_argument('--cart-days', type=int, default=settings.RETENTION_CART_DAYS,
+                            help="Purge carts untouched for this many days")
+        parser.add_argument('--pending-days', type=int, default=settings.RETENTION_PENDING_DAYS,
+                            help="Purge pending transactions older than this many days")
+        parser.add_argument('--batch-size', type=int, default=settings.RETENTION_BATCH_SIZE,
+                            help="Rows per batch")
+        parser.add_argument('--pause', type=float, default=settings.RETENTION_BATCH_PAUSE,
+                            help="Seconds to sleep between batches")
+
+    def handle(self, *args, **options):
+        batch = {'batch_size': options['batch_size'], 'pause': options['pause']}
+        jobs = [
+            ("stale pending transactions", retention.purge_stale_pending_transactions, options['pending_days']),
+            ("abandoned carts",
+             partial(retention.purge_abandoned_carts, pending_days=options['pending_days']),
+             options['cart_days']),
+            ("transactions archived", retention.archive_transactions, options['archive_days']),
+            ("orders archived", retention.archive_orders, options['archive_days']),
+            ("expired idempotency keys", retention.purge_expired_idempotency_keys, None),
+        ]
+
+        for label, job, days in jobs:
+            started = time.monotonic()
+            rows = job(**batch) if days is None else job(days=days, **batch)
+            elapsed = time.monotonic() - started
+            rate = rows / elapsed if elapsed else 0
+            self.stdout.write(f"{label}: {rows} rows in {elapsed:.2f}s ({rate:.0f} rows/s)")
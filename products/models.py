@@ -8,10 +8,12 @@ class CustomUser(AbstractUser):
 
 
 class Product(models.Model):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=250)
     price = models.IntegerField() # in pesewas
     quantity = models.IntegerField(default=1)
     description = models.TextField()
+    content_hash = models.CharField(max_length=64, blank=True, default='') # set by catalog imports
     
     def __str__(self):
         return self.name
@@ -26,6 +28,7 @@ class Transaction(models.Model):
 
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def total_amount(self):
         total = sum([item.subtotal() for item in self.items.all()])
@@ -45,6 +48,7 @@ class Order(models.Model):
     status = models.CharField(max_length=20, default="pending")
     total_amount = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
+    rolled_up = models.BooleanField(default=False)  # counted in the daily sales rollups
     
     def __str__(self):
         return f"Order {self.reference} by {self.user.username}"
@@ -57,8 +61,91 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
-    
 
-    
-    
 
+# ------------------------
+# Idempotency keys (see products/idempotency.py)
+# ------------------------
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of the request it was first used with
+    status_code = models.PositiveSmallIntegerField(null=True)  # null while the first request is running
+    locked_until = models.DateTimeField()  # an unfinished claim can be taken over after this
+    claim_token = models.CharField(max_length=32)  # identifies the request currently holding the key
+    response_body = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+
+
+# ------------------------
+# Daily sales rollups (see products/reporting.py)
+# ------------------------
+class DailySales(models.Model):
+    day = models.DateField(unique=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Sales for {self.day}"
+
+
+class DailyProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    order_count = models.PositiveIntegerField(default=0)
+    units_sold = models.PositiveBigIntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_daily_product_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} sales for {self.day}"
+
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+
+
+# ------------------------
+# Archive tables (see products/retention.py)
+# ------------------------
+class TransactionArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(db_index=True)
+    email = models.EmailField()
+    amount = models.IntegerField()
+    reference = models.CharField(max_length=100, db_index=True)  # references can be reused once archived
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+
+class OrderArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(db_index=True)
+    reference = models.CharField(max_length=100, db_index=True)  # references can be reused once archived
+    status = models.CharField(max_length=20)
+    total_amount = models.IntegerField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived order {self.reference}"
+
+
+class OrderItemArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order_id = models.BigIntegerField(db_index=True)
+    product_id = models.BigIntegerField()
+    quantity = models.PositiveBigIntegerField()
+    price_at_purchase = models.IntegerField()
@@ -0,0 +1,162 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import (
+    Transaction,
+    TransactionArchive,
+    Cart,
+    Order,
+    OrderArchive,
+    OrderItem,
+    OrderItemArchive,
+    IdempotencyKey,
+)
+
+# Retention jobs walk the hot tables in primary key order ("keyset" batches)
+# so every batch is a short index range scan plus one short transaction.
+# Sleeping between batches keeps the load low enough to run during the day.
+
+
+def _cutoff(days):
+    return timezone.now() - timedelta(days=days)
+
+
+def _run_in_batches(queryset, handle_batch, batch_size, pause):
+    """
+    Feed `queryset` to `handle_batch` in primary key ordered chunks.
+    Returns the total number of rows processed.
+    """
+    processed = 0
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            break
+        with db_transaction.atomic():
+            processed += handle_batch(batch)
+        last_pk = batch[-1].pk
+        if len(batch) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return processed
+
+
+def archive_transactions(days=None, batch_size=None, pause=None):
+    days = settings.RETENTION_ARCHIVE_DAYS if days is None else days
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+
+    def handle(batch):
+        TransactionArchive.objects.bulk_create([
+            TransactionArchive(
+                id=t.pk,
+                user_id=t.user_id,
+                email=t.email,
+                amount=t.amount,
+                reference=t.reference,
+                status=t.status,
+                created_at=t.created_at,
+            )
+            for t in batch
+        ], ignore_conflicts=True)
+        # Only delete what is confirmed to be in the archive
+        archived = TransactionArchive.objects.filter(pk__in=[t.pk for t in batch]).values_list('pk', flat=True)
+        deleted, _ = Transaction.objects.filter(pk__in=list(archived)).delete()
+        return deleted
+
+    queryset = Transaction.objects.filter(created_at__lt=_cutoff(days)).exclude(status='pending')
+    return _run_in_batches(queryset, handle, batch_size, pause)
+
+
+def archive_orders(days=None, batch_size=None, pause=None):
+    days = settings.RETENTION_ARCHIVE_DAYS if days is None else days
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+
+    def handle(batch):
+        OrderArchive.objects.bulk_create([
+            OrderArchive(
+                id=o.pk,
+                user_id=o.user_id,
+                reference=o.reference,
+                status=o.status,
+                total_amount=o.total_amount,
+                created_at=o.created_at,
+            )
+            for o in batch
+        ], ignore_conflicts=True)
+        # Only move orders confirmed to be in the archive
+        order_ids = list(OrderArchive.objects.filter(pk__in=[o.pk for o in batch]).values_list('pk', flat=True))
+        OrderItemArchive.objects.bulk_create([
+            OrderItemArchive(
+                id=item.pk,
+                order_id=item.order_id,
+                product_id=item.product_id,
+                quantity=item.quantity,
+                price_at_purchase=item.price_at_purchase,
+            )
+            for item in OrderItem.objects.filter(order_id__in=order_ids)
+        ], ignore_conflicts=True)
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        deleted, _ = Order.objects.filter(pk__in=order_ids).delete()
+        return deleted
+
+    queryset = Order.objects.filter(created_at__lt=_cutoff(days))
+    return _run_in_batches(queryset, handle, batch_size, pause)
+
+
+def purge_abandoned_carts(days=None, batch_size=None, pause=None, pending_days=None):
+    days = settings.RETENTION_CART_DAYS if days is None else days
+    pending_days = settings.RETENTION_PENDING_DAYS if pending_days is None else pending_days
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+    cutoff = _cutoff(days)
+
+    # The webhook turns the cart into the order, so keep carts with a payment in flight
+    live_payment = Transaction.objects.filter(
+        user=OuterRef('user'), status='pending', created_at__gte=_cutoff(pending_days)
+    )
+    abandoned = Cart.objects.filter(updated_at__lt=cutoff).filter(~Exists(live_payment))
+
+    def handle(batch):
+        # Re-check so a cart touched or paid for since it was selected survives
+        _, per_model = abandoned.filter(pk__in=[c.pk for c in batch]).delete()
+        return per_model.get(Cart._meta.label, 0)
+
+    return _run_in_batches(abandoned.only('pk'), handle, batch_size, pause)
+
+
+def purge_stale_pending_transactions(days=None, batch_size=None, pause=None):
+    days = settings.RETENTION_PENDING_DAYS if days is None else days
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+    cutoff = _cutoff(days)
+
+    def handle(batch):
+        # The webhook may have completed a payment since the batch was read
+        deleted, _ = Transaction.objects.filter(
+            pk__in=[t.pk for t in batch], status='pending', created_at__lt=cutoff
+        ).delete()
+        return deleted
+
+    queryset = Transaction.objects.filter(status='pending', created_at__lt=cutoff).only('pk')
+    return _run_in_batches(queryset, handle, batch_size, pause)
+
+
+def purge_expired_idempotency_keys(batch_size=None, pause=None):
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+    now = timezone.now()
+
+    def handle(batch):
+        deleted, _ = IdempotencyKey.objects.filter(pk__in=[k.pk for k in batch]).delete()
+        return deleted
+
+    queryset = IdempotencyKey.objects.filter(expires_at__lt=now).only('pk')
+    return _run_in_batches(queryset, handle, batch_size, pause)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Product, Transaction, Cart, CartItem, Order, OrderItem
+from .models import Product, Transaction, Cart, CartItem, Order, OrderItem, DailySales
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -10,7 +10,7 @@ User = get_user_model()
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ['content_hash']
 
 
 # ------------------------
@@ -70,3 +70,18 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'reference', 'status', 'total_amount', 'created_at', 'items']
 
+
+# ------------------------
+# Sales Report Serializers
+# ------------------------
+class DailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySales
+        fields = ['day', 'order_count', 'revenue']
+
+
+class TopProductSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    product_name = serializers.CharField(source='product__name')
+    units_sold = serializers.IntegerField()
+    revenue = serializers.IntegerField()
@@ -2,8 +2,21 @@ from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import Product, Cart, CartItem, Transaction
+from django.conf import settings
+from .models import Product, Cart, CartItem, Transaction, Order, OrderItem, TransactionArchive, OrderArchive, OrderItemArchive, DailySales, DailyProductSales, IdempotencyKey
+from . import events, retention, reporting
+from .catalog_import import import_products, iter_rows
+from datetime import timedelta
+from django.test import TestCase, RequestFactory, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from unittest import mock
+from asgiref.sync import sync_to_async
+from smartgear_api.db_routing import PrimaryReplicaRouter, ReplicaPinMiddleware, PIN_COOKIE
+from django.utils import timezone
+import io
 import json
+import requests
 import hmac
 import hashlib
 from smartgear_api.settings import PAYSTACK_SECRET_KEY
@@ -88,3 +101,408 @@ class CheckoutFlowTests(APITestCase):
         )
         self.assertEqual(response.status_code, 400)
         self.assertIn("error", response.data)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="olduser", email="old@example.com", password="pass1234")
+        self.product = Product.objects.create(name="Old Product", price=500, description="")
+        self.long_ago = timezone.now() - timedelta(days=400)
+
+    def test_archive_moves_old_transactions_and_orders(self):
+        old_tx = Transaction.objects.create(user=self.user, email=self.user.email, amount=100, reference="old-tx", status="success")
+        Transaction.objects.create(user=self.user, email=self.user.email, amount=100, reference="new-tx", status="success")
+        Transaction.objects.filter(pk=old_tx.pk).update(created_at=self.long_ago)
+        order = Order.objects.create(user=self.user, reference="old-order", status="success", total_amount=500)
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price_at_purchase=500)
+        Order.objects.filter(pk=order.pk).update(created_at=self.long_ago)
+
+        self.assertEqual(retention.archive_transactions(days=365, batch_size=1, pause=0), 1)
+        self.assertEqual(retention.archive_orders(days=365, batch_size=1, pause=0), 1)
+
+        self.assertEqual(list(Transaction.objects.values_list("reference", flat=True)), ["new-tx"])
+        self.assertTrue(TransactionArchive.objects.filter(pk=old_tx.pk, reference="old-tx").exists())
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(OrderArchive.objects.filter(pk=order.pk).exists())
+        self.assertEqual(OrderItemArchive.objects.filter(order_id=order.pk).count(), 1)
+
+    def test_reused_reference_is_archived_twice(self):
+        for _ in range(2):
+            tx = Transaction.objects.create(user=self.user, email=self.user.email, amount=100, reference="reused", status="success")
+            Transaction.objects.filter(pk=tx.pk).update(created_at=self.long_ago)
+            order = Order.objects.create(user=self.user, reference="reused", status="success", total_amount=100)
+            Order.objects.filter(pk=order.pk).update(created_at=self.long_ago)
+            retention.archive_transactions(days=365, pause=0)
+            retention.archive_orders(days=365, pause=0)
+
+        self.assertEqual(TransactionArchive.objects.filter(reference="reused").count(), 2)
+        self.assertEqual(OrderArchive.objects.filter(reference="reused").count(), 2)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_purge_abandoned_carts_and_stale_pending(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=self.long_ago)
+        active_user = User.objects.create_user(username="active", email="active@example.com", password="pass1234")
+        Cart.objects.create(user=active_user)
+        stale = Transaction.objects.create(user=self.user, email=self.user.email, amount=100, reference="stale", status="pending")
+        Transaction.objects.filter(pk=stale.pk).update(created_at=self.long_ago)
+        Transaction.objects.create(user=active_user, email=active_user.email, amount=100, reference="fresh", status="pending")
+
+        self.assertEqual(retention.purge_abandoned_carts(days=30, pause=0), 1)
+        self.assertEqual(retention.purge_stale_pending_transactions(days=2, pause=0), 1)
+
+        self.assertEqual(list(Cart.objects.values_list("user", flat=True)), [active_user.pk])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(list(Transaction.objects.values_list("reference", flat=True)), ["fresh"])
+        self.assertFalse(TransactionArchive.objects.exists())
+
+    def test_cart_with_payment_in_flight_is_kept(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=self.long_ago)
+        Transaction.objects.create(user=self.user, email=self.user.email, amount=500, reference="paying", status="pending")
+
+        self.assertEqual(retention.purge_abandoned_carts(days=30, pending_days=2, pause=0), 0)
+        self.assertTrue(CartItem.objects.filter(cart=cart).exists())
+
+
+@override_settings(DATABASE_REPLICAS=[])
+class SalesReportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="ops", email="ops@example.com", password="pass1234")
+        self.buyer = User.objects.create_user(username="buyer", email="buyer@example.com", password="pass1234")
+        self.mouse = Product.objects.create(name="Mouse", price=200, description="")
+        self.keyboard = Product.objects.create(name="Keyboard", price=500, description="")
+
+    def _order(self, reference, *items):
+        order = Order.objects.create(user=self.buyer, reference=reference, status="success", total_amount=0)
+        for product, quantity in items:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price_at_purchase=product.price)
+        return order
+
+    def test_record_order_counts_each_order_once(self):
+        order = self._order("r1", (self.mouse, 2), (self.keyboard, 1))
+        self.assertTrue(reporting.record_order(order))
+        self.assertFalse(reporting.record_order(order))
+        self.assertEqual(reporting.catch_up(), 0)
+
+        daily = DailySales.objects.get()
+        self.assertEqual((daily.order_count, daily.revenue), (1, 900))
+        mouse = DailyProductSales.objects.get(product=self.mouse)
+        self.assertEqual((mouse.order_count, mouse.units_sold, mouse.revenue), (1, 2, 400))
+
+    def test_catch_up_processes_only_new_orders(self):
+        self._order("r1", (self.mouse, 1))
+        self.assertEqual(reporting.catch_up(), 1)
+        self._order("r2", (self.mouse, 3))
+        self.assertEqual(reporting.catch_up(batch_size=1), 1)
+        self.assertEqual(DailyProductSales.objects.get(product=self.mouse).units_sold, 4)
+
+    def test_webhook_order_is_all_or_nothing(self):
+        Transaction.objects.create(user=self.buyer, email=self.buyer.email, amount=200, reference="wh-1", status="pending")
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=self.mouse, quantity=1)
+        payload = json.dumps({
+            "event": "charge.success",
+            "data": {"reference": "wh-1", "amount": 200, "customer": {"email": self.buyer.email}, "status": "success"}
+        }).encode()
+        signature = hmac.new(PAYSTACK_SECRET_KEY.encode(), payload, hashlib.sha512).hexdigest()
+
+        with mock.patch("products.views.reporting.record_order", side_effect=RuntimeError("rollup failed")):
+            self.client.post(reverse("products:paystack-webhook"), data=payload,
+                             content_type="application/json", HTTP_X_PAYSTACK_SIGNATURE=signature)
+
+        # Nothing half-written for catch_up to pick up
+        self.assertFalse(Order.objects.filter(reference="wh-1").exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertTrue(CartItem.objects.filter(cart=cart).exists())
+
+    def test_sales_report_endpoint(self):
+        reporting.record_order(self._order("r1", (self.mouse, 1), (self.keyboard, 2)))
+        reporting.record_order(self._order("r2", (self.mouse, 1)))
+
+        self.client.force_authenticate(user=self.buyer)
+        self.assertEqual(self.client.get(reverse("products:sales-report")).status_code, 403)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse("products:sales-report"), {"top": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["order_count"], 2)
+        self.assertEqual(response.data["revenue"], 1400)
+        self.assertEqual([p["product_name"] for p in response.data["top_products"]], ["Keyboard"])
+
+        response = self.client.get(reverse("products:sales-report"), {"start": "not-a-date"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+
+    def _route(self, request, model):
+        seen = {}
+
+        def view(request):
+            seen["db"] = self.router.db_for_read(model)
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(view)(request)
+        return seen["db"], response
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Product), "default")
+        self.assertEqual(self.router.db_for_write(Product), "default")
+
+    def test_safe_catalog_reads_use_replica(self):
+        db, _ = self._route(self.factory.get("/api/products/"), Product)
+        self.assertEqual(db, "replica_0")
+        db, _ = self._route(self.factory.get("/api/cart/"), Cart)
+        self.assertEqual(db, "default")
+
+    @override_settings(DATABASE_REPLICAS=["replica_0", "replica_1"])
+    def test_one_replica_per_request(self):
+        seen = set()
+
+        def view(request):
+            for _ in range(20):
+                seen.add(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        ReplicaPinMiddleware(view)(self.factory.get("/api/products/"))
+        self.assertEqual(len(seen), 1)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_pin_lookup_without_replicas(self):
+        with mock.patch("smartgear_api.db_routing.cache") as cache:
+            db, _ = self._route(self.factory.get("/api/products/", HTTP_AUTHORIZATION="Bearer t"), Product)
+            self._route(self.factory.post("/api/cart/add/", HTTP_AUTHORIZATION="Bearer t"), Product)
+        self.assertEqual(db, "default")
+        self.assertFalse(cache.method_calls)
+
+    def test_reads_stick_to_primary_after_write(self):
+        auth = {"HTTP_AUTHORIZATION": "Bearer token-1"}
+        db, response = self._route(self.factory.post("/api/cart/add/", **auth), Product)
+        self.assertEqual(db, "default")
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # A JWT client without a cookie jar is pinned through the cache
+        db, _ = self._route(self.factory.get("/api/products/", **auth), Product)
+        self.assertEqual(db, "default")
+
+        # ... including when an EventSource sends the same JWT as ?token=
+        db, _ = self._route(self.factory.get("/api/transactions/ref/events/", {"token": "token-1"}), Transaction)
+        self.assertEqual(db, "default")
+
+        db, _ = self._route(self.factory.get("/api/products/", HTTP_AUTHORIZATION="Bearer token-2"), Product)
+        self.assertEqual(db, "replica_0")
+
+
+class IdempotencyKeyTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="retry", email="retry@example.com", password="pass1234")
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name="Cable", price=100, description="")
+
+    def test_cart_add_is_replayed(self):
+        data = {"product_id": self.product.id, "quantity": 2}
+        first = self.client.post(reverse("products:cart-add"), data, HTTP_IDEMPOTENCY_KEY="k1")
+        second = self.client.post(reverse("products:cart-add"), data, HTTP_IDEMPOTENCY_KEY="k1")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+    def test_key_reused_for_different_request(self):
+        self.client.post(reverse("products:cart-add"), {"product_id": self.product.id}, HTTP_IDEMPOTENCY_KEY="k1")
+        response = self.client.post(reverse("products:cart-add"), {"product_id": self.product.id, "quantity": 5}, HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_duplicate_of_running_request(self):
+        data = {"product_id": self.product.id}
+        self.client.post(reverse("products:cart-add"), data, HTTP_IDEMPOTENCY_KEY="k1")
+        IdempotencyKey.objects.update(status_code=None, response_body=None)
+        response = self.client.post(reverse("products:cart-add"), data, HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(response.status_code, 409)
+
+    def test_orphaned_claim_is_taken_over_after_its_lease(self):
+        data = {"product_id": self.product.id}
+        self.client.post(reverse("products:cart-add"), data, HTTP_IDEMPOTENCY_KEY="k1")
+        # As if the worker died before storing the response
+        IdempotencyKey.objects.update(status_code=None, response_body=None, locked_until=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.post(reverse("products:cart-add"), data, HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Idempotent-Replayed"))
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 200)
+
+    @mock.patch("products.views.requests.post")
+    def test_initialize_payment_calls_paystack_once(self, paystack_post):
+        paystack_post.return_value.status_code = 200
+        paystack_post.return_value.json.return_value = {"data": {"authorization_url": "https://paystack.test/pay"}}
+
+        for _ in range(2):
+            response = self.client.post(reverse("products:transactions-initialize-payment"), {"reference": "ref-1"}, HTTP_IDEMPOTENCY_KEY="pay-1")
+            self.assertEqual(response.data, {"auth_url": "https://paystack.test/pay"})
+        self.assertEqual(paystack_post.call_count, 1)
+        self.assertEqual(Transaction.objects.filter(reference="ref-1").count(), 1)
+
+    @mock.patch("products.views.requests.post")
+    def test_server_errors_are_not_stored(self, paystack_post):
+        paystack_post.side_effect = requests.ConnectionError("down")
+        response = self.client.post(reverse("products:transactions-initialize-payment"), {"reference": "ref-2"}, HTTP_IDEMPOTENCY_KEY="pay-2")
+        self.assertEqual(response.status_code, 502)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def _taken_over_during_request(self, paystack_result):
+        # Paystack stalls the first request past its lease and a retry takes the key over
+        def paystack(*args, **kwargs):
+            IdempotencyKey.objects.update(claim_token="retry", locked_until=timezone.now() + timedelta(seconds=30))
+            if isinstance(paystack_result, Exception):
+                raise paystack_result
+            return mock.Mock(status_code=200, json=lambda: {"data": {"authorization_url": paystack_result}})
+
+        with mock.patch("products.views.requests.post", side_effect=paystack) as paystack_post:
+            self.client.post(reverse("products:transactions-initialize-payment"), {"reference": "ref-3"}, HTTP_IDEMPOTENCY_KEY="pay-3")
+        self.assertEqual(paystack_post.call_args.kwargs["timeout"], settings.PAYSTACK_TIMEOUT)
+        return IdempotencyKey.objects.get()
+
+    def test_stale_request_does_not_overwrite_takeover(self):
+        record = self._taken_over_during_request("https://paystack.test/stale")
+        self.assertEqual(record.claim_token, "retry")
+        self.assertIsNone(record.status_code)
+
+    def test_stale_request_does_not_delete_takeover(self):
+        record = self._taken_over_during_request(requests.Timeout("slow"))
+        self.assertEqual(record.claim_token, "retry")
+
+
+class CatalogImportTests(APITestCase):
+    CSV_FEED = (
+        "sku,name,price,quantity,description\n"
+        "SG-1,Headphones,15000,4,Over-ear\n"
+        "SG-2,Charger,3000,10,USB-C\n"
+        "SG-3,Broken,not-a-price,1,\n"
+    )
+
+    def test_csv_import_upserts_by_sku_and_skips_unchanged(self):
+        stats = import_products(iter_rows(io.StringIO(self.CSV_FEED), "csv"), chunk_size=2)
+        self.assertEqual((stats["rows"], stats["created"], stats["errors"]), (3, 2, 1))
+
+        feed = self.CSV_FEED.replace("Charger,3000", "Charger,3500")
+        stats = import_products(iter_rows(io.StringIO(feed), "csv"))
+        self.assertEqual((stats["created"], stats["updated"], stats["unchanged"]), (0, 1, 1))
+        self.assertEqual(Product.objects.get(sku="SG-2").price, 3500)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_ndjson_import(self):
+        feed = '{"sku": "SG-9", "name": "Mouse", "price": 900}\n\n{"sku": "SG-9", "name": "Mouse", "price": 950}\n'
+        stats = import_products(iter_rows(io.StringIO(feed), "ndjson"))
+        self.assertEqual((stats["rows"], stats["created"]), (2, 1))
+        self.assertEqual(Product.objects.get(sku="SG-9").price, 950)
+
+    def test_bad_rows_are_rejected_without_aborting(self):
+        lines = ['{"sku": "OK-%d", "name": "Good", "price": 100}' % i for i in range(10)]
+        lines.insert(5, '{"sku": "BROKEN", "name": ')
+        lines.append('{"sku": "%s", "name": "Long", "price": 100}' % ("X" * 65))
+        lines.append('{"sku": "OK-LONG", "name": "%s", "price": 100}' % ("N" * 251))
+        lines.append('{"sku": "NO-NAME", "name": null, "price": 100}')
+        lines.append('{"sku": "BLANK-NAME", "name": " ", "price": 100}')
+        stats = import_products(iter_rows(io.StringIO("\n".join(lines)), "ndjson"), chunk_size=2)
+
+        self.assertEqual((stats["rows"], stats["created"], stats["errors"]), (15, 10, 5))
+        self.assertTrue(stats["error_details"][0].startswith("row 6:"))
+        self.assertEqual(Product.objects.count(), 10)
+
+    def test_import_endpoint_is_staff_only(self):
+        user = User.objects.create_user(username="shopper", email="shopper@example.com", password="pass1234")
+        self.client.force_authenticate(user=user)
+        upload = SimpleUploadedFile("feed.csv", self.CSV_FEED.encode())
+        response = self.client.post(reverse("products:products-import-catalog"), {"file": upload})
+        self.assertEqual(response.status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        # Spreadsheet exports often start with a byte order mark
+        upload = SimpleUploadedFile("feed.csv", self.CSV_FEED.encode("utf-8-sig"))
+        response = self.client.post(reverse("products:products-import-catalog"), {"file": upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertNotIn("content_hash", self.client.get(reverse("products:products-list")).data["results"][0])
+
+
+@override_settings(SSE_KEEPALIVE_SECONDS=0.05, SSE_MAX_SECONDS=5)
+class PaymentEventsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="waiter", email="waiter@example.com", password="pass1234")
+        Transaction.objects.create(user=self.user, email=self.user.email, amount=1000, reference="ref-sse", status="pending")
+        self.url = reverse("products:transaction-events", args=["ref-sse"])
+
+    async def _next_event(self, chunks):
+        async for chunk in chunks:
+            chunk = chunk.decode()
+            if not chunk.startswith(":"):
+                return chunk
+        return None
+
+    async def test_requires_owner(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+        other = await User.objects.acreate(username="other", email="other@example.com")
+        await self.async_client.aforce_login(other)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_stream_ends_when_order_exists(self):
+        await Order.objects.acreate(user=self.user, reference="ref-sse", status="success", total_amount=1000)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        chunks = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[0].startswith("event: transaction\n"))
+        self.assertIn('"status": "pending"', chunks[0])
+        self.assertTrue(chunks[1].startswith("event: order\n"))
+
+    async def test_stream_pushes_published_updates(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        chunks = response.streaming_content.__aiter__()
+        self.assertIn('"status": "pending"', await self._next_event(chunks))
+
+        await sync_to_async(events.publish)("ref-sse", "transaction", {"reference": "ref-sse", "status": "success"})
+        self.assertIn('"status": "success"', await self._next_event(chunks))
+
+        await sync_to_async(events.publish)("ref-sse", "order", {"reference": "ref-sse", "order_id": 1})
+        self.assertTrue((await self._next_event(chunks)).startswith("event: order\n"))
+        self.assertIsNone(await self._next_event(chunks))
+
+    async def test_idle_stream_reads_database_once(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch("products.events._snapshot", wraps=events._snapshot) as snapshot:
+            response = await self.async_client.get(self.url)
+            chunks = response.streaming_content.__aiter__()
+            await self._next_event(chunks)
+            for _ in range(3):
+                self.assertEqual((await chunks.__anext__()).decode(), ": keepalive\n\n")
+        self.assertEqual(snapshot.call_count, 1)
+
+    def test_webhook_publishes_status_changes(self):
+        Cart.objects.create(user=self.user)
+        payload = json.dumps({
+            "event": "charge.success",
+            "data": {"reference": "ref-sse", "amount": 1000, "customer": {"email": self.user.email}, "status": "success"}
+        }).encode()
+        signature = hmac.new(PAYSTACK_SECRET_KEY.encode(), payload, hashlib.sha512).hexdigest()
+
+        with mock.patch("products.events.publish") as publish, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("products:paystack-webhook"), data=payload,
+                             content_type="application/json", HTTP_X_PAYSTACK_SIGNATURE=signature)
+        self.assertEqual([c.args[:2] for c in publish.call_args_list], [("ref-sse", "transaction"), ("ref-sse", "order")])
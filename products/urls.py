@@ -5,7 +5,9 @@ from .views import (
     TransactionViewSet,
     PaystackWebhookView,
     CartViewSet,
-    RegisterView
+    RegisterView,
+    SalesReportView,
+    payment_events,
 )
 
 router = DefaultRouter()
@@ -16,7 +18,9 @@ router.register(r'cart', CartViewSet, basename='cart')
 app_name = "products"
 
 urlpatterns = [
+    path('transactions/<str:reference>/events/', payment_events, name='transaction-events'),
     path('', include(router.urls)), 
     path('register/', RegisterView.as_view(), name='registerview'), 
     path('paystack/webhook/', PaystackWebhookView.as_view(), name='paystack-webhook'),
+    path('reports/sales/', SalesReportView.as_view(), name='sales-report'),
 ]
@@ -1,20 +1,41 @@
 import hashlib
 import hmac
+import io
 import json
 import requests
+from datetime import timedelta
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from django.contrib.auth import get_user_model
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
 from smartgear_api import settings
 from smartgear_api.settings import PAYSTACK_SECRET_KEY
-from .models import Product, Transaction, Cart, CartItem, Order, OrderItem
-from .serializers import ProductSerializer, TransactionSerializer, RegisterSerializer, CartItemSerializer
+from .models import Product, Transaction, Cart, CartItem, Order, OrderItem, DailySales, DailyProductSales
+from .serializers import (
+    ProductSerializer,
+    TransactionSerializer,
+    RegisterSerializer,
+    CartItemSerializer,
+    DailySalesSerializer,
+    TopProductSerializer,
+)
+from . import events, reporting
+from .idempotency import idempotent
+from .catalog_import import import_products, iter_rows
 
 User = get_user_model()
 
@@ -43,6 +64,28 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
     # permission_classes = [IsAuthenticated] 
     # Only authenticated users can view products
 
+    # Bulk upsert products by SKU from an uploaded CSV or NDJSON feed (staff only)
+    @action(detail=False, methods=['post'], url_path='import',
+            permission_classes=[IsAdminUser], parser_classes=[MultiPartParser])
+    def import_catalog(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A feed file is required'}, status=400)
+
+        fmt = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if fmt in ('jsonl', 'json'):
+            fmt = 'ndjson'
+        if fmt not in ('csv', 'ndjson'):
+            return Response({'error': 'Format must be csv or ndjson'}, status=400)
+
+        # Large uploads are spooled to disk by Django, so this reads the feed as a stream
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            stats = import_products(iter_rows(stream, fmt))
+        except ValueError as e:
+            return Response({'error': 'Invalid feed', 'details': str(e)}, status=400)
+        return Response(stats)
+
 
 # ------------------------
 # Cart Management ViewSet
@@ -58,6 +101,7 @@ class CartViewSet(viewsets.ViewSet):
 
     # Add a product to the cart (or increase quantity if it already exists)
     @action(detail=False, methods=['post'])
+    @idempotent
     def add(self, request):
         product_id = request.data.get('product_id')
         quantity = int(request.data.get('quantity', 1))
@@ -73,15 +117,19 @@ class CartViewSet(viewsets.ViewSet):
             else:
                 item.quantity = quantity
             item.save()
+            # Bump the cart's updated_at so retention doesn't treat it as abandoned
+            cart.save(update_fields=['updated_at'])
             return Response({'message': 'Item added to cart'})
         except Product.DoesNotExist:
             return Response({'error': 'Product not found'}, status=404)
 
     # Clear all items in the cart
     @action(detail=False, methods=['post'])
+    @idempotent
     def clear(self, request):
         cart, _ = Cart.objects.get_or_create(user=request.user)
         cart.items.all().delete()
+        cart.save(update_fields=['updated_at'])
         return Response({'message': 'Cart cleared'})
 
 
@@ -98,6 +146,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
     # Custom route to initialize Paystack payment
     @action(detail=False, methods=['post'], url_path='initialize-payment')
+    @idempotent
     def initialize_payment(self, request):
         user = request.user
         email = user.email
@@ -105,6 +154,8 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
         # Compute total cart amount in minor currency (e.g. pesewas or kobo)
         cart, _ = Cart.objects.get_or_create(user=user)
+        # The webhook turns this cart into the order, so keep retention from purging it
+        cart.save(update_fields=['updated_at'])
         amount = int(sum([item.product.price * item.quantity for item in cart.items.all()]) * 100)
 
         if not reference:
@@ -123,7 +174,8 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
         # Call Paystack API to initialize payment
         try:
-            res = requests.post('https://api.paystack.co/transaction/initialize', json=data, headers=headers)
+            res = requests.post('https://api.paystack.co/transaction/initialize', json=data, headers=headers,
+                                timeout=settings.PAYSTACK_TIMEOUT)
             res.raise_for_status()
         except requests.RequestException as e:
             return Response({'error': 'Payment initialization failed', 'details': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
@@ -143,11 +195,54 @@ class TransactionViewSet(viewsets.ModelViewSet):
         return Response({'error': 'Payment initialization failed'}, status=res.status_code)
 
 
+# ------------------------
+# Sales Reporting View
+# ------------------------
+class SalesReportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    # Revenue and order counts per day, plus the top products, read from the daily rollups
+    def get(self, request):
+        try:
+            end = request.query_params.get('end')
+            end = parse_date(end) if end else timezone.localdate()
+            start = request.query_params.get('start')
+            start = parse_date(start) if start else end - timedelta(days=29)
+            top = int(request.query_params.get('top', 10))
+        except (TypeError, ValueError):
+            start = end = None
+        if start is None or end is None or top < 1:
+            return Response({'error': 'Use start/end as YYYY-MM-DD and a positive top'}, status=400)
+        if start > end:
+            return Response({'error': 'start must not be after end'}, status=400)
+
+        days = DailySales.objects.filter(day__range=(start, end)).order_by('day')
+        top_products = (
+            DailyProductSales.objects.filter(day__range=(start, end))
+            .values('product_id', 'product__name')
+            .annotate(units_sold=Sum('units_sold'), revenue=Sum('revenue'))
+            .order_by('-revenue')[:top]
+        )
+        totals = days.aggregate(order_count=Sum('order_count'), revenue=Sum('revenue'))
+
+        return Response({
+            'start': start,
+            'end': end,
+            'order_count': totals['order_count'] or 0,
+            'revenue': totals['revenue'] or 0,
+            'days': DailySalesSerializer(days, many=True).data,
+            'top_products': TopProductSerializer(top_products, many=True).data,
+        })
+
+
 # ------------------------
 # Paystack Webhook Handler
 # ------------------------
 @method_decorator(csrf_exempt, name='dispatch')
 class PaystackWebhookView(APIView):
+    # Paystack doesn't log in; the signature check below authenticates it
+    permission_classes = [AllowAny]
+
     def post(self, request, *args, **kwargs):
         try:
             # Verify signature to ensure request came from Paystack
@@ -187,6 +282,9 @@ class PaystackWebhookView(APIView):
                     if not created:
                         transaction.status = 'success'
                         transaction.save()
+                        db_transaction.on_commit(lambda: events.publish(
+                            reference, 'transaction', {'reference': reference, 'status': 'success'}
+                        ))
                     
                     # 
 
@@ -194,25 +292,36 @@ class PaystackWebhookView(APIView):
                         try:
                             cart = Cart.objects.get(user=user)
                             
-                            # Create the order
-                            order = Order.objects.create(
-                                user=user,
-                                reference=reference,
-                                status="success",
-                                total_amount=amount,
-                            )
-                            
-                            # Create OderItems from Cart
-                            cart_items = CartItem.objects.filter(user=user)
-                            for item in cart_items:
-                                OrderItem.objects.create(
-                                    order=order,
-                                    product=item.product,
-                                    quantity=item.quantity,
-                                    price_at_purchase=item.product.price
+                            # The order, its items, the cart clear and the rollup commit together,
+                            # so the rollup catch-up never sees an order without its items
+                            with db_transaction.atomic():
+                                # Create the order
+                                order = Order.objects.create(
+                                    user=user,
+                                    reference=reference,
+                                    status="success",
+                                    total_amount=amount,
                                 )
-                            # Clear cart
-                            cart_items.delete()
+                            
+                                # Create OderItems from Cart
+                                cart_items = CartItem.objects.filter(cart=cart)
+                                for item in cart_items:
+                                    OrderItem.objects.create(
+                                        order=order,
+                                        product=item.product,
+                                        quantity=item.quantity,
+                                        price_at_purchase=item.product.price
+                                    )
+                                # Clear cart
+                                cart_items.delete()
+
+                                # Add the order to the daily sales rollups
+                                reporting.record_order(order)
+
+                                # Tell any client streaming this payment's status
+                                db_transaction.on_commit(lambda: events.publish(
+                                    reference, 'order', events.order_event(order)
+                                ))
                         except Cart.DoesNotExist:
                             pass
 
@@ -224,3 +333,40 @@ class PaystackWebhookView(APIView):
 
         # Always return 200 so Paystack knows the webhook was received
         return Response(status=status.HTTP_200_OK)
+
+
+# ------------------------
+# Payment Status Stream (SSE)
+# ------------------------
+async def _authenticate(request):
+    # EventSource can't send headers, so a JWT may also come as ?token=
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    header = request.headers.get('Authorization', '')
+    raw_token = header[len('Bearer '):] if header.startswith('Bearer ') else request.GET.get('token')
+    if not raw_token:
+        return None
+    auth = JWTAuthentication()
+    try:
+        validated_token = auth.get_validated_token(raw_token)
+        return await sync_to_async(auth.get_user)(validated_token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def payment_events(request, reference):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    user = await _authenticate(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+    # On the primary, so a payment initialized a moment ago is found even if the replica lags
+    if not await Transaction.objects.using('default').filter(reference=reference, user=user).aexists():
+        return JsonResponse({'error': 'Transaction not found'}, status=404)
+
+    response = StreamingHttpResponse(events.payment_event_stream(reference), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let proxies buffer the stream
+    return response
@@ -8,9 +8,38 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+import re
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartgear_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402  (needs django.setup())
+
+# Server-sent event streams (products.views.payment_events) stay open for minutes
+EVENT_STREAM_PATH = re.compile(r'^/api/transactions/[^/]+/events/$')
+
+
+class EventStreamHandler(ASGIHandler):
+    """
+    Serves long-lived event streams without a per-request ThreadSensitiveContext.
+    Django normally gives every request its own executor thread for sync code
+    (middleware, ORM calls) and keeps it until the response finishes, so each
+    idle stream would hold an OS thread. Here that short setup work runs on
+    asgiref's single shared thread instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.handle(scope, receive, send)
+
+
+event_stream_application = EventStreamHandler()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and EVENT_STREAM_PATH.match(scope['path']):
+        await event_stream_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,125 @@
+"""
+Read-replica routing for smartgear_api.
+
+Catalog and history reads from safe (GET/HEAD/OPTIONS) requests go to one of
+the replicas listed in ``settings.DATABASE_REPLICAS``. Everything else uses the
+primary (``default``) database: writes, carts and users, any read made while
+handling a POST/PUT/PATCH/DELETE, and any code running outside a request
+(management commands, the shell).
+
+After a client writes, its reads stay on the primary for
+``settings.REPLICA_PIN_SECONDS`` so it never sees replication lag. The pin is
+kept in a cookie and in the cache, keyed by the client's credentials, so it
+works for both browser sessions and JWT clients. The cache must be shared by
+all workers (settings.py refuses a per-process cache outside DEBUG), or a
+client's next read may land on a worker that doesn't know about its pin.
+"""
+
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+PIN_COOKIE = 'db_primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Models whose reads may be served from a replica
+REPLICA_MODELS = {
+    'products.product',
+    'products.transaction',
+    'products.order',
+    'products.orderitem',
+    'products.dailysales',
+    'products.dailyproductsales',
+}
+
+# Where replica-eligible reads go. Primary unless a request has picked a
+# replica; one replica per request, so e.g. a page's count and rows agree.
+_read_db = ContextVar('read_db', default='default')
+
+
+@contextmanager
+def use_primary():
+    token = _read_db.set('default')
+    try:
+        yield
+    finally:
+        _read_db.reset(token)
+
+
+def _client_key(request):
+    # A JWT counts the same whether it arrives as "Bearer <token>" or as ?token=
+    # (EventSource can't send headers)
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    credentials = (
+        header.split(' ', 1)[-1]
+        or request.GET.get('token')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return 'db-primary-pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def _is_pinned(request):
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    key = _client_key(request)
+    return bool(key and cache.get(key))
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        read_db = _read_db.get()
+        if read_db == 'default' or model._meta.label_lower not in REPLICA_MODELS:
+            return 'default'
+        # Follow relations on the database the instance was loaded from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return read_db
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaPinMiddleware:
+    """
+    Allows replica reads for safe requests from clients that haven't written
+    recently, and pins a client to the primary after it writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        is_write = request.method not in SAFE_METHODS
+        if is_write or _is_pinned(request):
+            read_db = 'default'
+        else:
+            read_db = random.choice(settings.DATABASE_REPLICAS)
+        token = _read_db.set(read_db)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_db.reset(token)
+
+        if is_write:
+            seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+            key = _client_key(request)
+            if key:
+                cache.set(key, True, seconds)
+        return response
@@ -73,6 +73,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'smartgear_api.db_routing.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -107,6 +108,40 @@ DATABASES = {
     'default': dj_database_url.config(default=config('DATABASE_URL'))
 }
 
+# Read replicas, e.g. DATABASE_REPLICA_URLS=postgres://replica1/db,postgres://replica2/db
+# Catalog and history reads are routed to them by smartgear_api.db_routing.
+DATABASE_REPLICAS = []
+for index, url in enumerate(u.strip() for u in config('DATABASE_REPLICA_URLS', default='').split(',') if u.strip()):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(url)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['smartgear_api.db_routing.PrimaryReplicaRouter']
+
+# Seconds a client's reads stay on the primary after it writes
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+# Cache. The replica pin for JWT clients lives here, so with replicas it must be
+# shared by every worker, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# with CACHE_LOCATION=redis://..., or django.core.cache.backends.db.DatabaseCache
+# with CACHE_LOCATION=cache_table (then run `python manage.py createcachetable`).
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+if DATABASE_REPLICAS and not DEBUG and CACHES['default']['BACKEND'] in PER_PROCESS_CACHES:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(
+        "DATABASE_REPLICA_URLS needs a cache shared by all workers; set CACHE_BACKEND and CACHE_LOCATION"
+    )
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -160,6 +195,27 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user
 AUTH_USER_MODEL = 'products.CustomUser'
 
+# Idempotency-Key header on payment initialization and cart mutations
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)  # seconds
+IDEMPOTENCY_WAIT_SECONDS = config('IDEMPOTENCY_WAIT_SECONDS', default=10, cast=float)
+# How long an unfinished request holds its key before a retry may take it over
+IDEMPOTENCY_LOCK_SECONDS = config('IDEMPOTENCY_LOCK_SECONDS', default=IDEMPOTENCY_WAIT_SECONDS * 3, cast=float)
+# Seconds to wait for Paystack; keep it well under IDEMPOTENCY_LOCK_SECONDS so a
+# payment initialization finishes before a retry can take over its key
+PAYSTACK_TIMEOUT = config('PAYSTACK_TIMEOUT', default=10, cast=float)
+
+# Server-sent payment status events (GET /api/transactions/<reference>/events/)
+PAYMENT_EVENTS_BROKER = config('PAYMENT_EVENTS_BROKER', default='products.events.InProcessBroker')
+SSE_KEEPALIVE_SECONDS = config('SSE_KEEPALIVE_SECONDS', default=15, cast=float)
+SSE_MAX_SECONDS = config('SSE_MAX_SECONDS', default=300, cast=float)
+
+# Data retention (python manage.py run_retention)
+RETENTION_ARCHIVE_DAYS = config('RETENTION_ARCHIVE_DAYS', default=365, cast=int)
+RETENTION_CART_DAYS = config('RETENTION_CART_DAYS', default=30, cast=int)
+RETENTION_PENDING_DAYS = config('RETENTION_PENDING_DAYS', default=2, cast=int)
+RETENTION_BATCH_SIZE = config('RETENTION_BATCH_SIZE', default=500, cast=int)
+RETENTION_BATCH_PAUSE = config('RETENTION_BATCH_PAUSE', default=0.1, cast=float)
+
 # Swagger settings
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {